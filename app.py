@@ -1,67 +1,174 @@
 import streamlit as st
 import os
+import random
+import re
 import time
-import json
-import requests
+import hashlib
+import io
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import httpx
+from cachetools import TTLCache
+from diskcache import Cache
 from dotenv import load_dotenv
-from agno.agent import Agent
-from agno.models.openai.like import OpenAILike
-from agno.tools.duckduckgo import DuckDuckGoTools
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Load environment variables
 load_dotenv()
 
+# Sutra API endpoint
+SUTRA_BASE_URL = "https://api.two.ai/v2"
+
+# On-disk cache for agent responses, shared across workers and restarts
+_RESPONSE_CACHE_DIR = os.getenv(
+    "SUTRA_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sutra")
+)
+_RESPONSE_TTL = 3600
+
+# Seconds a request waits on an identical in-flight request before running its own
+_INFLIGHT_TIMEOUT = 60
+
+# Total time a search may take before falling back to the date-enhanced query
+_SEARCH_TIME_BUDGET = 4.0
+
+# Matches a line that starts a numbered list item
+_NUMBERED_RE = re.compile(r'(?m)^\s*\d+\.\s')
+
+# Matches queries that ask for time-sensitive information worth a web search
+_TEMPORAL_RE = re.compile(
+    r"\b(today|tonight|yesterday|now|current|currently|latest|recent|recently|breaking|this week|this month)\b",
+    re.IGNORECASE
+)
+
 # Add current date information to query
-def add_date_to_query(query):
-    current_date = time.strftime("%Y-%m-%d")
+def add_date_to_query(query, current_date):
     enhanced_query = f"{query}\n\nToday's date is {current_date}. Please provide the most up-to-date information available."
     return enhanced_query
 
+# In-process search result cache, shared across reruns and sessions
+@st.cache_resource(show_spinner=False)
+def get_search_cache():
+    return TTLCache(maxsize=256, ttl=600), threading.Lock()
+
+# On-disk response cache, opened once per process
+@st.cache_resource
+def get_response_cache():
+    return Cache(_RESPONSE_CACHE_DIR, size_limit=2**30)
+
+# Agent calls currently running across all sessions, keyed like the response cache
+@st.cache_resource
+def get_inflight_responses():
+    return {}, threading.Lock()
+
+# Shared DuckDuckGo client so its HTTP session is reused across reruns
+@st.cache_resource(show_spinner=False)
+def get_ddgs():
+    # Import the search client
+    from duckduckgo_search import DDGS
+    return DDGS(timeout=20)
+
 # Search for recent information using DuckDuckGo
-def search_with_duckduckgo(query, num_results=5, max_retries=2):
-    try:
-        # Import the search function
-        from duckduckgo_search import DDGS
-        
-        # Create a new DDGS instance with a timeout and proxies
-        ddgs = DDGS(timeout=20)
+def search_with_duckduckgo(query, num_results=5, max_retries=2, time_budget=_SEARCH_TIME_BUDGET):
+    # Return cached results for repeated queries
+    cache_key = (query, num_results)
+    search_cache, search_lock = get_search_cache()
+    with search_lock:
+        cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Reuse the pooled DDGS instance; errors are raised to the caller rather than shown here
+    ddgs = get_ddgs()
+    
+    # Add retry logic, bounded by a total time budget so a flaky search can't stall the UI
+    deadline = time.monotonic() + time_budget
+    for attempt in range(max_retries):
+        is_last_attempt = attempt == max_retries - 1
+        try:
+            # Search for the query
+            results = list(ddgs.text(query, max_results=num_results))
+            
+            # If we got results, cache and return them
+            if results and len(results) > 0:
+                with search_lock:
+                    search_cache[cache_key] = results
+                return results
+        except Exception as inner_e:
+            # If this is the last attempt, raise the error
+            if is_last_attempt:
+                raise inner_e
         
-        # Add retry logic
-        for attempt in range(max_retries):
-            try:
-                # Search for the query
-                results = list(ddgs.text(query, max_results=num_results))
-                
-                # If we got results, return them
-                if results and len(results) > 0:
-                    return results
-                
-                # If no results but no error, wait and retry
-                time.sleep(2)  # Wait 2 seconds before retrying
-            except Exception as inner_e:
-                # If this is the last attempt, raise the error
-                if attempt == max_retries - 1:
-                    raise inner_e
-                
-                # Otherwise wait longer and retry
-                time.sleep(3)
+        if is_last_attempt:
+            break
         
-        # If we got here with no results, return empty list
-        return []
-    except Exception as e:
-        st.error(f"Error searching with DuckDuckGo: {str(e)}")
-        return None
+        # Wait a short jittered delay before retrying, unless it would blow the budget
+        delay = random.uniform(0.2, 0.6)
+        if time.monotonic() + delay > deadline:
+            break
+        time.sleep(delay)
+    
+    # If we got here with no results, return empty list
+    return []
+
+# Start the DuckDuckGo search in a background thread so it overlaps agent setup
+def start_search(query, num_results=5, max_retries=2):
+    ctx = get_script_run_ctx()
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def run_search():
+        # Attach the script context for the cached resources; the worker makes no UI
+        # calls, so it is harmless if the search outlives this run
+        add_script_run_ctx(ctx=ctx)
+        return search_with_duckduckgo(query, num_results, max_retries)
+
+    future = executor.submit(run_search)
+    executor.shutdown(wait=False)
+    return future
+
+# Shared HTTP/2 client so Sutra API calls reuse pooled connections
+@st.cache_resource
+def get_http_client():
+    return httpx.Client(
+        http2=True,
+        # Keep idle connections long enough to cover user think-time after a prewarm
+        limits=httpx.Limits(max_keepalive_connections=16, keepalive_expiry=300.0),
+        timeout=httpx.Timeout(60.0, connect=10.0)
+    )
+
+# Open a pooled connection to the Sutra API in the background while the user types
+def warm_sutra_connection():
+    # Warm once per browser session
+    if st.session_state.get("sutra_connection_warmed"):
+        return
+    st.session_state.sutra_connection_warmed = True
+    client = get_http_client()
+
+    def warm():
+        try:
+            client.head(SUTRA_BASE_URL, timeout=2)
+        except httpx.HTTPError:
+            # Warming is best effort; the real request will connect on its own
+            pass
+
+    threading.Thread(target=warm, daemon=True).start()
 
 # Create AI agent with tools
 @st.cache_resource
 def create_agent():
     try:
+        # Import agno only once an agent is actually needed
+        from agno.agent import Agent
+        from agno.models.openai.like import OpenAILike
+        
         # Initialize the Agent with Sutra model via OpenAILike wrapper
         agent = Agent(
             model=OpenAILike(
                 id="sutra-v2",
                 api_key=os.getenv("SUTRA_API_KEY"),
-                base_url="https://api.two.ai/v2"
+                base_url=SUTRA_BASE_URL,
+                http_client=get_http_client()
             ),
             markdown=True
         )
@@ -72,6 +179,104 @@ def create_agent():
         st.error(f"Failed to create agent: {str(e)}")
         return None
 
+# Extract the text content from an agent response or streamed chunk
+def extract_content(response):
+    if isinstance(response, str):
+        return response
+    if isinstance(response, dict):
+        content = response.get("content")
+    else:
+        content = getattr(response, "content", None)
+    # Structured content (e.g. tool output) is serialized back to JSON text
+    if content is not None and not isinstance(content, str):
+        import orjson
+        content = orjson.dumps(content, default=str).decode()
+    return content
+
+# Unwrap a reply that came back as a JSON object with a "content" field
+def unwrap_json_content(text):
+    stripped = text.lstrip()
+    # Only objects can carry a content field; '[' usually starts a markdown link
+    if not stripped.startswith("{"):
+        return text
+    
+    import orjson
+    try:
+        obj = orjson.loads(stripped)
+    except orjson.JSONDecodeError:
+        return text
+    if isinstance(obj, dict) and isinstance(obj.get("content"), str):
+        return obj["content"]
+    return text
+
+# Stream the agent response into a Streamlit container
+def stream_agent_response(agent, query, container, session_id=None, flush_interval=0.05):
+    buf = []
+    last_flush = time.monotonic()
+    pending = False
+    for chunk in agent.run(query, stream=True, session_id=session_id):
+        content = extract_content(chunk)
+        if not content:
+            continue
+        buf.append(content)
+        pending = True
+        
+        # Re-render on line breaks or once the flush interval has passed
+        now = time.monotonic()
+        if content.endswith("\n") or now - last_flush > flush_interval:
+            container.markdown("".join(buf))
+            last_flush = now
+            pending = False
+    
+    text = "".join(buf)
+    # Flush whatever arrived after the last render
+    if pending:
+        container.markdown(text)
+    return text
+
+# Get the agent response, coalescing identical prompts across sessions
+def get_agent_response(agent, query, current_date, container, session_id=None):
+    # Key on the date too so cached answers never outlive the day they were made
+    response_key = hashlib.sha256(f"{current_date}\n{query}".encode()).hexdigest()
+    # Reuse a recent response for an identical prompt (diskcache is thread-safe)
+    response_cache = get_response_cache()
+    cached = response_cache.get(response_key)
+    if cached is not None:
+        return cached
+    
+    inflight, inflight_lock = get_inflight_responses()
+    with inflight_lock:
+        # Join a request for the same prompt that is already in flight
+        future = inflight.get(response_key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            inflight[response_key] = future
+    
+    if not is_leader:
+        try:
+            with st.spinner("Waiting for an identical request to finish..."):
+                return future.result(timeout=_INFLIGHT_TIMEOUT)
+        except Exception:
+            # The leading request failed, was stopped or is too slow - run our own
+            return stream_agent_response(agent, query, container, session_id=session_id)
+    
+    try:
+        # Stream the response into the placeholder as chunks arrive
+        content = stream_agent_response(agent, query, container, session_id=session_id)
+        # Cache before releasing the in-flight entry so late arrivals find one or the other
+        if content:
+            response_cache.set(response_key, content, expire=_RESPONSE_TTL)
+        future.set_result(content)
+    finally:
+        # Streamlit stops scripts with BaseException subclasses, so never leave followers hanging
+        if not future.done():
+            future.set_exception(RuntimeError("The leading request stopped before finishing"))
+        with inflight_lock:
+            inflight.pop(response_key, None)
+    
+    return content
+
 # Sample questions for news summarization
 SAMPLE_QUESTIONS = [
     "Summarize the latest global economic news in Hindi",
@@ -79,6 +284,10 @@ SAMPLE_QUESTIONS = [
     "Summarize today's top sports headlines in German"
 ]
 
+# Queue a sample question to be processed on the next rerun
+def set_pending_query(question):
+    st.session_state.pending_query = question
+
 # Render sidebar content
 def render_sidebar():
     with st.sidebar:
@@ -132,6 +341,12 @@ def main():
     )
     
     
+    # Compute the date once per rerun for every prompt variant
+    today = time.strftime("%Y-%m-%d")
+    
+    # Pick up a sample question queued by its button callback
+    pending_query = st.session_state.pop("pending_query", None)
+    
     # Render sidebar
     show_tool_calls, use_search = render_sidebar()
     
@@ -143,16 +358,13 @@ def main():
     
     st.markdown("Get AI-powered news summaries in multiple languages using Agno's advanced capabilities.")
     
-    # Initialize agent
+    # Require an API key before showing the query form
     if "sutra_api_key" not in st.session_state or not st.session_state.sutra_api_key:
         st.warning("Please enter your Sutra API key in the sidebar to continue.")
-        agent = None
         return
-    else:
-        agent = create_agent()
-        if not agent:
-            st.error("Failed to initialize the AI agent. Please check your API key.")
-            return
+    
+    # Prewarm the API connection so the first query skips the TLS handshake
+    warm_sutra_connection()
     
     # Input form
     with st.form("query_form"):
@@ -164,15 +376,31 @@ def main():
         )
         submit = st.form_submit_button("Get Summary", use_container_width=True)
     
+    # A queued sample question takes the place of the form input
+    if pending_query:
+        query = pending_query
+        submit = True
+    
     # Sample questions
     st.subheader("Sample questions")
     for i, question in enumerate(SAMPLE_QUESTIONS):
-        if st.button(question, key=f"sample_{i}"):
-            query = question
-            submit = True
+        st.button(question, key=f"sample_{i}", on_click=set_pending_query, args=(question,))
     
     # Handle submission
     if submit and query.strip():
+        # Only search when the query asks for time-sensitive information
+        needs_search = use_search and _TEMPORAL_RE.search(query) is not None
+        
+        # Kick off the search first so its network latency hides behind agent setup
+        search_future = start_search(query, max_retries=2) if needs_search else None
+        search_deadline = time.monotonic() + _SEARCH_TIME_BUDGET
+        
+        # Initialize agent
+        agent = create_agent()
+        if not agent:
+            st.error("Failed to initialize the AI agent. Please check your API key.")
+            return
+        
         st.subheader("🌐 News Summary")
         
         # Create a placeholder for the streaming output
@@ -181,6 +409,10 @@ def main():
         # Configure the agent
         agent.show_tool_calls = show_tool_calls
         
+        # Give each browser session its own agent session on the shared agent
+        if "agent_session_id" not in st.session_state:
+            st.session_state.agent_session_id = uuid.uuid4().hex
+        
         # Initialize or reset the response in session state
         if "response" not in st.session_state or submit:
             st.session_state.response = ""
@@ -191,88 +423,84 @@ def main():
             if submit:
                 st.session_state.pop("full_response", None)
                 
-            # Single spinner for all processing
+            # Single spinner for the pre-call setup; the stream renders outside it
             with st.spinner("Processing your request..."):
-                # Get recent information if enabled
-                if use_search:
+                # Get recent information if enabled and relevant
+                if needs_search:
                     # Show debug info
                     st.info(f"Searching for recent information about: {query}")
                     
                     try:
-                        # Use DuckDuckGo search with retry logic
-                        search_results = search_with_duckduckgo(query, max_retries=2)
+                        # Wait for the background DuckDuckGo search, but never past the budget
+                        search_results = search_future.result(
+                            timeout=max(0.0, search_deadline - time.monotonic())
+                        )
                         
                         if search_results and len(search_results) > 0:
                             # Show success message
                             # st.success(f"Found {len(search_results)} recent results from DuckDuckGo")
                             
                             # Extract relevant information from search results
-                            recent_info = "\n\nRecent information from search results:\n"
+                            recent_info = "\n\nRecent information from search results:\n\n" + "\n\n".join(
+                                f"{idx+1}. {result.get('title', '')}: {result.get('body', '')}"
+                                for idx, result in enumerate(search_results[:3])
+                            ) + "\n"
                             
-                            for idx, result in enumerate(search_results[:3]):
-                                recent_info += f"\n{idx+1}. {result.get('title', '')}: {result.get('body', '')}\n"
-                                
                             # Append recent information to the query
-                            enhanced_query = f"{query}\n\nUse this recent information to provide an up-to-date response: {recent_info}\n\nToday's date is {time.strftime('%Y-%m-%d')}"
-                            st.session_state.full_response = agent.run(enhanced_query, stream=False)
+                            enhanced_query = f"{query}\n\nUse this recent information to provide an up-to-date response: {recent_info}\n\nToday's date is {today}"
                         else:
                             # Fallback: Just add date information
                             st.warning("Could not retrieve recent information from DuckDuckGo. Using date-enhanced query.")
-                            date_enhanced_query = add_date_to_query(query)
-                            st.session_state.full_response = agent.run(date_enhanced_query, stream=False)
+                            enhanced_query = add_date_to_query(query, today)
+                    except FutureTimeoutError:
+                        # Search is too slow - don't hold up the response
+                        st.warning("DuckDuckGo search timed out. Using date-enhanced query.")
+                        enhanced_query = add_date_to_query(query, today)
                     except Exception as e:
                         # Handle any unexpected errors
                         st.error(f"Error during search: {str(e)}")
                         # Fallback: Just add date information
                         st.warning("Using date-enhanced query as fallback.")
-                        date_enhanced_query = add_date_to_query(query)
-                        st.session_state.full_response = agent.run(date_enhanced_query, stream=False)
+                        enhanced_query = add_date_to_query(query, today)
+                elif use_search:
+                    # Nothing time-sensitive to look up - just add date information
+                    enhanced_query = add_date_to_query(query, today)
                 else:
                     # No search enabled - just run with original query
-                    st.session_state.full_response = agent.run(query, stream=False)
-                
-                # Get the response from the agent
-                response = st.session_state.full_response
-                
-                # Extract only the content from the RunResponse object
-                if hasattr(response, 'content'):
-                    # If it's a RunResponse object with content attribute
-                    clean_content = response.content
-                else:
-                    # Fallback to string representation but clean it up
-                    response_str = str(response)
-                    # Try to extract just the content part if it's a RunResponse string representation
-                    if "RunResponse(content='" in response_str:
-                        try:
-                            # Extract content between the first single quotes after content=
-                            start_idx = response_str.find("content='") + 9
-                            end_idx = response_str.find("'", start_idx)
-                            clean_content = response_str[start_idx:end_idx]
-                        except:
-                            clean_content = response_str
-                    else:
-                        clean_content = response_str
-                
-                # Format the content based on its structure
-                if '1.' in clean_content and '2.' in clean_content:
-                    # It's likely a numbered list, keep the formatting
-                    response_container.markdown(clean_content)
-                else:
-                    # For regular text, add some paragraph spacing
-                    paragraphs = clean_content.split('\n\n')
-                    formatted_content = '\n\n'.join([f"<p>{p}</p>" for p in paragraphs])
-                    response_container.markdown(formatted_content, unsafe_allow_html=True)
-                
-                # Store for display
-                st.session_state.response = clean_content
-                
+                    enhanced_query = query
+            
+            # Get the response, shared with any identical request already running
+            clean_content = get_agent_response(
+                agent, enhanced_query, today, response_container,
+                session_id=st.session_state.agent_session_id
+            )
+            clean_content = unwrap_json_content(clean_content)
+            st.session_state.full_response = clean_content
+            
+            # Format the content based on its structure
+            if _NUMBERED_RE.search(clean_content):
+                # It's likely a numbered list, keep the formatting
+                response_container.markdown(clean_content)
+            else:
+                # For regular text, add some paragraph spacing
+                buf = io.StringIO()
+                write = buf.write
+                for p in clean_content.split('\n\n'):
+                    write("<p>")
+                    write(p)
+                    write("</p>\n\n")
+                response_container.markdown(buf.getvalue(), unsafe_allow_html=True)
+            
+            # Store for display
+            st.session_state.response = clean_content
+            
 
-        
+    
     # Simple action button
     if st.button("New Query"):
-        st.session_state.response = ""
-        st.session_state.full_response = ""
-        st.experimental_rerun()
+        # The click already reruns the script, so just drop the previous result
+        for key in ("response", "full_response"):
+            st.session_state.pop(key, None)
     
     elif submit and not query.strip():
         st.warning("Please enter a valid question.")